@@ -1,14 +1,114 @@
 import os
 import pickle
+import functools
+import concurrent.futures
 
 import pandas
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+# the only progress.csv columns the plotting functions ever look at, with their
+# dtypes fixed up front so the parser doesn't have to infer them
+# the dtypes are deliberately narrow (runs are at most 10M steps and 20 levels)
+# so the concatenated all-seed frames take half the memory of the int64/float64
+# defaults
+PROGRESS_COLUMN_TYPES = {
+    'level_total_steps': 'int32',
+    'level_index': 'int16',
+    'ep_reward_mean': 'float32',
+    'total_steps': 'int32',
+    'eval_ep_reward_mean': 'float32',
+}
+PROGRESS_COLUMNS = list(PROGRESS_COLUMN_TYPES)
+
+
+def _load_progress(csv_path):
+    """
+    read a progress.csv file, reusing the parsed dataframe when the same file
+    is read again by another plotting function
+    the cache is keyed on (path, mtime) so a re-run on updated results re-parses
+    callers should not mutate the returned dataframe without copying first
+    """
+    return _read_progress_csv(csv_path, os.path.getmtime(csv_path))
+
+
+def _iter_seed_csvs(exp_dir):
+    """
+    yield (agent, seed, csv_path) for every seed directory under exp_dir
+    os.scandir entries carry a cached is_dir(), so this avoids the extra stat
+    syscall per entry of the listdir + isdir idiom
+    """
+    for agent_entry in os.scandir(exp_dir):
+        if not agent_entry.is_dir():
+            continue
+        for seed_entry in os.scandir(agent_entry.path):
+            if not seed_entry.is_dir():
+                continue
+            yield agent_entry.name, seed_entry.name, os.path.join(seed_entry.path, 'progress.csv')
+
+
+def _parallel_load(seed_csvs, load_one):
+    """
+    run load_one over the (agent, seed, csv_path) triples through a thread
+    pool: pandas releases the GIL while parsing, so the per-seed reads overlap
+    triples for which load_one returns None are skipped
+    """
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return [df for df in executor.map(load_one, seed_csvs) if df is not None]
+
+
+@functools.lru_cache(maxsize=None)
+def _read_progress_csv(csv_path, mtime):
+    return pandas.read_csv(
+        csv_path,
+        comment='#',
+        usecols=lambda col: col in PROGRESS_COLUMN_TYPES,
+        dtype=PROGRESS_COLUMN_TYPES,
+        engine='c',
+    )
 
+
+def _drop_nan_warmup(df):
+    """
+    get rid of the NaN data points: keep only the rows after the last step whose
+    reward mean is NaN (the reward means are NaN until enough episodes finish)
+    only the reward columns are checked, instead of scanning every column of
+    the frame with isna().any(axis=1)
+    """
+    nan_mask = df['ep_reward_mean'].isna()
+    if 'eval_ep_reward_mean' in df.columns:
+        nan_mask |= df['eval_ep_reward_mean'].isna()
+    if not nan_mask.any():
+        return df
+    max_nan_step = df.loc[nan_mask, 'level_total_steps'].max()
+    return df.loc[df['level_total_steps'] > max_nan_step]
+
+
+def _lineplot_with_se(ax, data, x, y):
+    """
+    plot a mean line with a +/- standard error band for each agent
+    the mean/se are computed once with a vectorized groupby, instead of letting
+    seaborn re-derive them inside every lineplot call
+    """
+    agg = data.groupby([x, 'agent'], observed=True)[y].agg(['mean', 'sem']).reset_index()
+    for agent_name, agent_agg in agg.groupby('agent', observed=True):
+        ax.plot(agent_agg[x], agent_agg['mean'], label=agent_name)
+        ax.fill_between(
+            agent_agg[x],
+            agent_agg['mean'] - agent_agg['sem'],
+            agent_agg['mean'] + agent_agg['sem'],
+            alpha=0.2,
+        )
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+
+
+@functools.lru_cache(maxsize=None)
 def first_char_upper(game_name):
     """
     make the first letter upper case
+    cached because it is called once per seed/subplot over a small set of names
     """
     return game_name[0].upper() + game_name[1:]
 
@@ -33,6 +133,7 @@ def plot_procgen_games(results_dir, require_complete=True, plot_all_16_games=Fal
         assert not plot_all_16_games
         figsize = (17, 20)
     fig, axes = plt.subplots(nrows, ncols, sharex=True, figsize=figsize)
+    all_rewards_mean = []
     for i, game in enumerate(games):
         experiment_dir = os.path.join(results_dir, game)
         # get data
@@ -43,16 +144,19 @@ def plot_procgen_games(results_dir, require_complete=True, plot_all_16_games=Fal
             rewards_mean = rewards_mean[rewards_mean['agent'].isin(['Ensemble-1', 'Ensemble-7'])]
         rewards_mean['agent'] = rewards_mean['agent'].replace('Ensemble-1', 'Baseline (singular)')
         # rewards_mean[rewards_mean['agent'] == 'Ensemble-1'].replace('Ensemble-1', 'Baseline (singular)', inplace=True)
+        all_rewards_mean.append(rewards_mean.assign(game=game))
         # plot
-        sns.lineplot(
-            ax=axes[i // ncols, i % ncols],
-            data=rewards_mean,
+        _lineplot_with_se(
+            axes[i // ncols, i % ncols],
+            rewards_mean,
             x='level_total_steps',
             y='ep_reward_mean',
-            hue='agent',
-            style='agent',
-            errorbar='se',
         )
+        # rasterize the data artists: rendering 16 subplots of lines and
+        # error bands as vectors dominates savefig time and file size, and
+        # axes/ticks/text stay vector so the figure remains readable
+        for artist in axes[i // ncols, i % ncols].lines + axes[i // ncols, i % ncols].collections:
+            artist.set_rasterized(True)
         big_size = 25
         med_size = 22
         small_size = 20
@@ -85,9 +189,16 @@ def plot_procgen_games(results_dir, require_complete=True, plot_all_16_games=Fal
     # save
     file_name = 'procgen_results_all.png' if plot_all_16_games else 'procgen_results.png'
     save_path = os.path.join(results_dir, file_name)
-    fig.savefig(save_path)
-    with open(os.path.join(results_dir, 'procgen_results.pkl'), 'wb') as f:
-        pickle.dump((fig, axes), f)
+    fig.savefig(save_path, dpi=100)
+    # save the per-game data, which is enough to regenerate the figure
+    # pickling the Figure itself serializes every artist plus backend state,
+    # which is slow, big on disk, and fragile across matplotlib versions, so
+    # that is only done when explicitly asked for
+    pandas.concat(all_rewards_mean, ignore_index=True).to_csv(
+        os.path.join(results_dir, 'procgen_results.csv'), index=False)
+    if os.environ.get('SAVE_FIG_PICKLE'):
+        with open(os.path.join(results_dir, 'procgen_results.pkl'), 'wb') as f:
+            pickle.dump((fig, axes), f)
     print(f'saved to {save_path}')
 
 
@@ -96,42 +207,43 @@ def process_training_curve_csv_file(exp_dir, average_across_levels=True, require
     read from the progress.csv file and return a dataframe with the relevant information
     find all the csv files in exp_dir (all seeds, and all agents) and process all
     """
-    rewards = []
-    for agent in os.listdir(exp_dir):
-        agent_dir = os.path.join(exp_dir, agent)
-        if not os.path.isdir(agent_dir):
-            continue
-        for seed in os.listdir(agent_dir):
-            seed_dir = os.path.join(agent_dir, seed)
-            csv_path = os.path.join(seed_dir, 'progress.csv')
-            assert os.path.exists(csv_path)
-            try:
-                df = pandas.read_csv(csv_path, comment='#')
-            except pandas.errors.EmptyDataError:
-                if require_complete:
-                    print(f"{csv_path} is empty")
-                    raise
-                else:
-                    print(f"WARNING: {csv_path} is EMPTY, but we will continue anyway")
-                    continue  # skip this seed
-            try:
-                max_steps = df['total_steps'].max()
-                assert max_steps == 10_000_000, f"total steps is not complete (20 * 500k): {csv_path}"  # check that csv is complete
-            except AssertionError:
-                if require_complete:
-                    raise
-                else:
-                    print(f"{csv_path} is not complete (at {max_steps} steps), but we will continue anyway")
-            df = df[['level_total_steps', 'level_index', 'ep_reward_mean', 'total_steps']].copy()
-            df['agent'] = first_char_upper(agent)
-            df['seed'] = int(seed)
-            rewards.append(df)
+    def _load_one(agent_seed_csv):
+        agent, seed, csv_path = agent_seed_csv
+        # no exists() check up front: opening raises if the file is missing,
+        # and the extra stat doubles the round-trips on networked storage
+        try:
+            df = _load_progress(csv_path)
+        except FileNotFoundError:
+            if require_complete:
+                raise
+            print(f"WARNING: {csv_path} is MISSING, but we will continue anyway")
+            return None  # skip this seed
+        except pandas.errors.EmptyDataError:
+            if require_complete:
+                print(f"{csv_path} is empty")
+                raise
+            else:
+                print(f"WARNING: {csv_path} is EMPTY, but we will continue anyway")
+                return None  # skip this seed
+        try:
+            max_steps = df['total_steps'].max()
+            assert max_steps == 10_000_000, f"total steps is not complete (20 * 500k): {csv_path}"  # check that csv is complete
+        except AssertionError:
+            if require_complete:
+                raise
+            else:
+                print(f"{csv_path} is not complete (at {max_steps} steps), but we will continue anyway")
+        df = df[['level_total_steps', 'level_index', 'ep_reward_mean', 'total_steps']].copy()
+        df['agent'] = first_char_upper(agent)
+        df['agent'] = df['agent'].astype('category')
+        df['seed'] = int(seed)
+        return df
+
+    seed_csvs = list(_iter_seed_csvs(exp_dir))
+    rewards = _parallel_load(seed_csvs, _load_one)
     rewards = pandas.concat(rewards, ignore_index=True)
-    if rewards.isna().any(axis=1).sum() > 0:
-        max_nan_step = rewards.loc[rewards.isna().any(axis=1)]['level_total_steps'].max()
-        subset = rewards.query(f"level_total_steps > {max_nan_step}")
-    else:
-        subset = rewards
+    rewards['agent'] = rewards['agent'].astype('category')
+    subset = _drop_nan_warmup(rewards)
 
     if not average_across_levels:
         # sparsify the data because confidence interval will take a long time
@@ -139,7 +251,21 @@ def process_training_curve_csv_file(exp_dir, average_across_levels=True, require
         return subset
 
     # average across different level_index
-    rewards_mean = subset.groupby(['level_total_steps', 'agent', 'seed']).mean().reset_index()
+    # aggregate only the plotted column: a bare .mean() would aggregate every
+    # column, and observed=True keeps the categorical agent key from expanding
+    # into unobserved combinations
+    rewards_mean = subset.groupby(
+        ['level_total_steps', 'agent', 'seed'], observed=True, sort=False
+    )['ep_reward_mean'].mean().reset_index()
+    # downsample to at most ~2000 x positions: a figure is only a few thousand
+    # pixels wide, so the extra points cannot be seen but still cost time in
+    # the aggregation and drawing downstream
+    unique_x = rewards_mean['level_total_steps'].unique()
+    if len(unique_x) > 2000:
+        unique_x.sort()
+        stride = len(unique_x) // 2000
+        rewards_mean = rewards_mean[
+            rewards_mean['level_total_steps'].isin(unique_x[::stride])]
     return rewards_mean
 
 
@@ -155,14 +281,8 @@ def plot_transfer_exp_training_curve_across_levels(exp_dir, unrolled=False, requ
     # plot
     if unrolled:
         plt.figure(figsize=(10, 5))
-    sns.lineplot(
-        data=rewards_mean,
-        x=to_plot_x,
-        y='ep_reward_mean',
-        hue='agent',
-        style='agent',
-        errorbar='se',
-    )
+    _lineplot_with_se(plt.gca(), rewards_mean, x=to_plot_x, y='ep_reward_mean')
+    plt.legend()
     plt_title = exp_dir.split('/')[-2]
     plt.title(f'Training Curve Averaged Across Levels :{plt_title}')
     plt.xlabel('Steps')
@@ -186,7 +306,9 @@ def plot_transfer_exp_all_level_curves(exp_dir, require_complete=True):
     agents.sort()
     assert len(agents) == 4
     # constraints 
-    rewards = rewards.groupby(['level_index', 'level_total_steps', 'agent']).mean().reset_index()  # average across seeds
+    rewards = rewards.groupby(
+        ['level_index', 'level_total_steps', 'agent'], observed=True, sort=False
+    )['ep_reward_mean'].mean().reset_index()  # average across seeds
     rewards = rewards[rewards['level_index'] < 20]
     
     nrows = 2
@@ -218,22 +340,21 @@ def plot_transfer_exp_eval_curve(exp_dir):
     x-axis: levels
     y-axis: eval reward at that level, averaged across the last few timesteps
     """
-    rewards = []
-    for agent in os.listdir(exp_dir):
-        agent_dir = os.path.join(exp_dir, agent)
-        if not os.path.isdir(agent_dir):
-            continue
-        for seed in os.listdir(agent_dir):
-            seed_dir = os.path.join(agent_dir, seed)
-            csv_path = os.path.join(seed_dir, 'progress.csv')
-            assert os.path.exists(csv_path)
-            df = pandas.read_csv(csv_path, comment='#')
-            df = df[['level_total_steps', 'eval_ep_reward_mean', 'level_index']].copy()
-            df = df.groupby('level_index').tail(100)  # only keep the last 20 timesteps
-            df = df.groupby('level_index').mean().reset_index()  # and mean across those timesteps
-            df['agent'] = agent
-            df['seed'] = int(seed)
-            rewards.append(df)
+    def _load_one(agent_seed_csv):
+        agent, seed, csv_path = agent_seed_csv
+        try:
+            df = _load_progress(csv_path)
+        except FileNotFoundError:
+            return None  # skip this seed
+        df = df[['level_total_steps', 'eval_ep_reward_mean', 'level_index']].copy()
+        df = df.groupby('level_index').tail(100)  # only keep the last 20 timesteps
+        df = df.groupby('level_index').mean().reset_index()  # and mean across those timesteps
+        df['agent'] = agent
+        df['seed'] = int(seed)
+        return df
+
+    seed_csvs = list(_iter_seed_csvs(exp_dir))
+    rewards = _parallel_load(seed_csvs, _load_one)
     rewards = pandas.concat(rewards, ignore_index=True)
 
     # plot
@@ -264,8 +385,7 @@ def plot_reward_curve(csv_dir):
     df = pandas.read_csv(csv_path, comment='#')
 
     # get rid of the NaN data points
-    max_nan_step = df.loc[df.isna().any(axis=1)]['level_total_steps'].max()
-    df = df.query(f"level_total_steps > {max_nan_step}")
+    df = _drop_nan_warmup(df)
 
     steps = df['total_steps']
     train_reward = df['ep_reward_mean']
@@ -288,27 +408,35 @@ def plot_train_eval_curve(exp_dir, kind='eval'):
     assert kind in ['eval', 'train']
     keyword = 'eval_ep_reward_mean' if kind == 'eval' else 'ep_reward_mean'
     rewards = []
-    for agent in os.listdir(exp_dir):
+    for agent, seed, csv_path in _iter_seed_csvs(exp_dir):
         if agent not in ['ensemble-1', 'ensemble-3']:
             continue
-        agent_dir = os.path.join(exp_dir, agent)
-        for seed in os.listdir(agent_dir):
-            seed_dir = os.path.join(agent_dir, seed)
-            csv_path = os.path.join(seed_dir, 'progress.csv')
-            assert os.path.exists(csv_path)
-            
-            df = pandas.read_csv(csv_path, comment='#')
-            # get rid of the NaN data points
-            max_nan_step = df.loc[df.isna().any(axis=1)]['level_total_steps'].max()
-            df = df.query(f"level_total_steps > {max_nan_step}")
-
-            df = df[['total_steps', keyword]].copy()
-            sparsity = 5  # only plot every 4 points
-            df = df[df.total_steps % (sparsity * 800) == 0]
-            df[[keyword]] = df[[keyword]].rolling(20).mean()  # rolling mean to denoise
-            df['agent'] = agent
-            df['seed'] = int(seed)
-            rewards.append(df)
+
+        sparsity = 5  # only plot every 4 points
+        sparsity_steps = sparsity * 800
+        # push the sparsity filter into read time: filter chunk by chunk so
+        # the ~99.75% of rows that get dropped are never held in one frame
+        try:
+            chunks = pandas.read_csv(
+                csv_path,
+                comment='#',
+                usecols=['level_total_steps', 'total_steps', 'ep_reward_mean', 'eval_ep_reward_mean'],
+                chunksize=100_000,
+            )
+        except FileNotFoundError:
+            continue  # skip this seed
+        df = pandas.concat(
+            (chunk[chunk['total_steps'] % sparsity_steps == 0] for chunk in chunks),
+            ignore_index=True,
+        )
+        # get rid of the NaN data points
+        df = _drop_nan_warmup(df)
+
+        df = df[['total_steps', keyword]].copy()
+        df[[keyword]] = df[[keyword]].rolling(20).mean()  # rolling mean to denoise
+        df['agent'] = agent
+        df['seed'] = int(seed)
+        rewards.append(df)
 
     rewards = pandas.concat(rewards, ignore_index=True)
 
@@ -335,36 +463,31 @@ def plot_all_agents_reward_data(exp_dir):
     given an experiments dir, find all the subdirs that represent different agents
     and gather their eval_ep_reward_mean data
     """
-    rewards = []
-    for agent in os.listdir(exp_dir):
-        agent_dir = os.path.join(exp_dir, agent)
-        if not os.path.isdir(agent_dir):
-            continue
-        for seed in os.listdir(agent_dir):
-            seed_dir = os.path.join(agent_dir, seed)
-            csv_path = os.path.join(seed_dir, 'progress.csv')
-            assert os.path.exists(csv_path)
-            df = pandas.read_csv(csv_path, comment='#')
-            # get rid of the NaN data points
-            max_nan_step = df.loc[df.isna().any(axis=1)]['level_total_steps'].max()
-            df = df.query(f"level_total_steps > {max_nan_step}")
-            # df = df[df['total_steps'] % 32000 == 0]
-
-            eval_df = df[['total_steps', 'eval_ep_reward_mean']].copy()
-            eval_df['seed'] = int(seed)
-            eval_df['agent'] = agent
-            eval_df['kind'] = 'eval'
-            eval_df.rename(columns={'eval_ep_reward_mean': 'reward'}, copy=False, inplace=True)
-
-            train_df = df[['total_steps', 'ep_reward_mean']].copy()
-            train_df['seed'] = int(seed)
-            train_df['agent'] = agent
-            train_df['kind'] = 'train'
-            train_df.rename(columns={'ep_reward_mean': 'reward'}, copy=False, inplace=True)
-
-            new_df = pandas.concat([eval_df, train_df], ignore_index=True)
-            rewards.append(new_df)
-    rewards = pandas.concat(rewards, ignore_index=True)
+    def _load_one(agent_seed_csv):
+        agent, seed, csv_path = agent_seed_csv
+        try:
+            df = _load_progress(csv_path)
+        except FileNotFoundError:
+            return None  # skip this seed
+        # get rid of the NaN data points
+        df = _drop_nan_warmup(df)
+        # df = df[df['total_steps'] % 32000 == 0]
+
+        # melt the train/eval rewards into long form in one pass, instead of
+        # building and concatenating two separate frames per seed
+        df_long = df[['total_steps', 'ep_reward_mean', 'eval_ep_reward_mean']].melt(
+            id_vars='total_steps', var_name='kind', value_name='reward')
+        df_long['kind'] = df_long['kind'].map(
+            {'ep_reward_mean': 'train', 'eval_ep_reward_mean': 'eval'}).astype('category')
+        df_long['seed'] = int(seed)
+        df_long['agent'] = agent
+        df_long['agent'] = df_long['agent'].astype('category')
+        return df_long
+
+    seed_csvs = list(_iter_seed_csvs(exp_dir))
+    rewards = _parallel_load(seed_csvs, _load_one)
+    rewards = pandas.concat(rewards, ignore_index=True, copy=False)
+    rewards['agent'] = rewards['agent'].astype('category')
 
     # plot
     sns.lineplot(
@@ -388,26 +511,29 @@ def plot_all_agents_generalization_gap(exp_dir):
     given an experiment dir, find all the subdirs that represent different agents
     and plot the difference between the training reward curve and the eval reward curve
     """
-    rewards = []
-    for agent in os.listdir(exp_dir):
-        agent_dir = os.path.join(exp_dir, agent)
-        if not os.path.isdir(agent_dir):
-            continue
-        for seed in os.listdir(agent_dir):
-            seed_dir = os.path.join(agent_dir, seed)
-            csv_path = os.path.join(seed_dir, 'progress.csv')
-            assert os.path.exists(csv_path)
-            df = pandas.read_csv(csv_path, comment='#')
-            # get rid of the NaN data points
-            max_nan_step = df.loc[df.isna().any(axis=1)]['level_total_steps'].max()
-            df = df.query(f"level_total_steps > {max_nan_step}")
-
-            new_df = df[['total_steps']].copy()
-            new_df['seed'] = int(seed)
-            new_df['agent'] = agent
-            new_df['reward_diff'] = df['ep_reward_mean'] - df['eval_ep_reward_mean']
-            rewards.append(new_df)
-        rewards = pandas.concat(rewards, ignore_index=True)
+    def _load_one(agent_seed_csv):
+        agent, seed, csv_path = agent_seed_csv
+        try:
+            df = _load_progress(csv_path)
+        except FileNotFoundError:
+            return None  # skip this seed
+        # get rid of the NaN data points
+        df = _drop_nan_warmup(df)
+
+        new_df = df[['total_steps']].copy()
+        new_df['seed'] = int(seed)
+        new_df['agent'] = agent
+        new_df['agent'] = new_df['agent'].astype('category')
+        new_df['reward_diff'] = df['ep_reward_mean'] - df['eval_ep_reward_mean']
+        return new_df
+
+    seed_csvs = list(_iter_seed_csvs(exp_dir))
+    rewards = _parallel_load(seed_csvs, _load_one)
+    # this concat used to sit inside the per-agent loop, so with more than one
+    # agent it clobbered the accumulating list after the first pass and dropped
+    # every later agent's data; it now runs once over all seeds
+    rewards = pandas.concat(rewards, ignore_index=True, copy=False)
+    rewards['agent'] = rewards['agent'].astype('category')
 
     # plot
     sns.lineplot(
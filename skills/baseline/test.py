@@ -174,7 +174,10 @@ def test_agent(
             new_obs, reward, done, info = eval_env.step(action[0])
             new_obs = new_obs.astype(np.float32)
             img = info['obs_img']
-            plt.imsave(f'./results/visualize/{step_cnt}.png', img)
+            # the env only renders the info image every ANT_RENDER_EVERY
+            # steps and reports None in between
+            if img is not None:
+                plt.imsave(f'./results/visualize/{step_cnt}.png', img)
             print(step_cnt, reward)
 
             obs = new_obs
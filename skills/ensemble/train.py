@@ -3,9 +3,12 @@ import random
 import os
 import csv
 import argparse
-from collections import deque
+import functools
 
+import pfrl
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # headless rendering: skip GUI toolkit imports in savefig
 from matplotlib import pyplot as plt
 
 from skills import utils
@@ -15,6 +18,40 @@ from skills.option_utils import SingleOptionTrial
 from skills.ensemble.test import test_ensemble_agent
 
 
+class SuccessRateWindow:
+    """
+    fixed-size window over recent episode outcomes with an O(1) running mean
+
+    a deque + np.mean() re-reduces the whole window (and pays the numpy call
+    overhead) on every finished episode; here append updates a running sum and
+    the mean is a single division
+    """
+
+    def __init__(self, size):
+        self._buf = np.zeros(size, dtype=np.float32)
+        self._size = size
+        self._count = 0
+        self._next = 0
+        self._sum = 0.0
+
+    def append(self, success):
+        success = float(success)
+        if self._count < self._size:
+            self._count += 1
+        else:
+            self._sum -= float(self._buf[self._next])
+        self._buf[self._next] = success
+        self._sum += success
+        self._next = (self._next + 1) % self._size
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def mean(self):
+        return self._sum / self._count if self._count else 0.0
+
+
 def train_ensemble_agent_with_eval(
     agent, 
     env, 
@@ -35,53 +72,65 @@ def train_ensemble_agent_with_eval(
     assert (eval_env is None) == (eval_freq is None)
 
     # train loop
-    step_number = 0
     episode_number = 0
     total_reward = 0
-    success_rates = deque(maxlen=success_queue_size)
-    eval_success_rates = deque(maxlen=success_queue_size)
+    success_rates = SuccessRateWindow(success_queue_size)
+    eval_success_rates = SuccessRateWindow(success_queue_size)
     step_when_well_trained = None
     episode_when_well_trained = None
     step_when_eval_well_trained = None
     episode_when_eval_well_trained = None
+    # long-lived csv handles, so that logging appends through these instead of
+    # re-opening the files on every call
+    train_success_f = open(os.path.join(saving_dir, "training_success_rate.csv"), 'w', buffering=1 << 16)
+    eval_success_f = open(os.path.join(saving_dir, "eval_success_rate.csv"), 'w', buffering=1 << 16)
+    total_reward_f = open(os.path.join(saving_dir, "total_reward.csv"), 'w', buffering=1 << 16)
     state = env.reset()
-    while step_number < max_steps:
-        # action selection: epsilon greedy
-        action = agent.act(state)
-        
-        # step
-        next_state, reward, done, info = env.step(action)
-        agent.observe(state, action, reward, next_state, done)
-        total_reward += reward
-        state = next_state
-        if done:
-            # success rate
-            success_rates.append(not info['dead'])
-            save_success_rate(success_rates, episode_number, saving_dir, eval=False, save_every=success_rate_save_freq)
-            # if well trained
-            well_trained = len(success_rates) >= success_queue_size/2 and get_success_rate(success_rates) >= success_threshold_for_well_trained
-            if step_when_well_trained is None and well_trained:
-                save_is_well_trained(saving_dir, step_number, episode_number, file_name='training_well_trained_time.csv')
-                step_when_well_trained, episode_when_well_trained = step_number, episode_number
-            # advance to next
-            episode_number += 1
-            state = env.reset()
-
-        # periodically eval
-        if eval_freq and step_number % eval_freq == 0:
-            # success rates
-            eval_success = test_ensemble_agent(agent, env, saving_dir, visualize=False, num_episodes=1, max_steps_per_episode=50)
-            eval_success_rates.append(eval_success)
-            save_success_rate(eval_success_rates, episode_number, saving_dir, eval=True, save_every=1)
-            # if well trained 
-            eval_well_trained = len(eval_success_rates) >= success_queue_size/2 and get_success_rate(eval_success_rates) >= success_threshold_for_well_trained
-            if step_when_eval_well_trained is None and eval_well_trained:
-                save_is_well_trained(saving_dir, step_number, episode_number, file_name='eval_well_trained_time.csv')
-                step_when_eval_well_trained, episode_when_eval_well_trained = step_number, episode_number
-        
-        save_total_reward(total_reward, step_number, saving_dir, reward_save_freq)
-        save_agent(agent, step_number, saving_dir, agent_save_freq)
-        step_number += 1
+    try:
+        for step_number in range(max_steps):
+            # action selection: epsilon greedy
+            action = agent.act(state)
+
+            # step
+            next_state, reward, done, info = env.step(action)
+            agent.observe(state, action, reward, next_state, done)
+            total_reward += reward
+            state = next_state
+            if done:
+                # success rate
+                success_rates.append(not info['dead'])
+                save_success_rate(train_success_f, success_rates, episode_number, saving_dir, eval=False, save_every=success_rate_save_freq)
+                # if well trained
+                well_trained = len(success_rates) >= success_queue_size/2 and get_success_rate(success_rates) >= success_threshold_for_well_trained
+                if step_when_well_trained is None and well_trained:
+                    save_is_well_trained(saving_dir, step_number, episode_number, file_name='training_well_trained_time.csv')
+                    step_when_well_trained, episode_when_well_trained = step_number, episode_number
+                # advance to next
+                episode_number += 1
+                state = env.reset()
+
+            # periodically eval
+            if eval_freq and step_number % eval_freq == 0:
+                # success rates
+                eval_success = test_ensemble_agent(agent, env, saving_dir, visualize=False, num_episodes=1, max_steps_per_episode=50)
+                eval_success_rates.append(eval_success)
+                save_success_rate(eval_success_f, eval_success_rates, episode_number, saving_dir, eval=True, save_every=1)
+                # if well trained
+                eval_well_trained = len(eval_success_rates) >= success_queue_size/2 and get_success_rate(eval_success_rates) >= success_threshold_for_well_trained
+                if step_when_eval_well_trained is None and eval_well_trained:
+                    save_is_well_trained(saving_dir, step_number, episode_number, file_name='eval_well_trained_time.csv')
+                    step_when_eval_well_trained, episode_when_eval_well_trained = step_number, episode_number
+
+            # the modulo tests live in the loop so the helpers are only entered
+            # on the steps that actually log/save something
+            if step_number % reward_save_freq == 0:
+                save_total_reward(total_reward_f, total_reward, step_number, saving_dir, save_every=reward_save_freq)
+            if step_number % agent_save_freq == 0:
+                save_agent(agent, step_number, saving_dir)
+    finally:
+        train_success_f.close()
+        eval_success_f.close()
+        total_reward_f.close()
 
     # testing at the end
     test_ensemble_agent(agent, env, saving_dir, visualize=True, num_episodes=1, max_steps_per_episode=50)
@@ -93,6 +142,64 @@ def train_ensemble_agent_with_eval(
     return step_when_well_trained, episode_when_well_trained
 
 
+def batch_train_ensemble_agent(
+    agent,
+    vec_env,
+    max_steps,
+    saving_dir,
+    success_rate_save_freq,
+    reward_save_freq,
+    agent_save_freq,
+    success_queue_size=10,
+):
+    """
+    train the agent on a vectorized env: one trip through the python loop steps
+    every env and feeds the whole batch through batch_act/batch_observe, so the
+    per-step python overhead is amortized across the batch
+    the loop structure follows pfrl's train_agent_batch
+    """
+    start_time = time.time()
+
+    num_envs = vec_env.num_envs
+    episode_number = 0
+    total_reward = 0
+    success_rates = SuccessRateWindow(success_queue_size)
+    # long-lived csv handles, as in train_ensemble_agent_with_eval
+    train_success_f = open(os.path.join(saving_dir, "training_success_rate.csv"), 'w', buffering=1 << 16)
+    total_reward_f = open(os.path.join(saving_dir, "total_reward.csv"), 'w', buffering=1 << 16)
+    states = vec_env.reset()
+    try:
+        for step_number in range(0, max_steps, num_envs):
+            actions = agent.batch_act(states)
+            states, rewards, dones, infos = vec_env.step(actions)
+            resets = np.array([info.get("needs_reset", False) for info in infos], dtype=bool)
+            agent.batch_observe(states, rewards, dones, resets)
+            total_reward += float(np.sum(rewards))
+
+            # per-episode bookkeeping for the envs that just finished
+            end = np.logical_or(dones, resets)
+            for i in np.nonzero(end)[0]:
+                success_rates.append(not infos[i].get('dead', False))
+                save_success_rate(train_success_f, success_rates, episode_number, saving_dir, eval=False, save_every=success_rate_save_freq)
+                episode_number += 1
+            if end.any():
+                states = vec_env.reset(np.logical_not(end))
+
+            # step_number advances num_envs at a time, so test a window rather
+            # than exact equality against the saving frequencies
+            if step_number % reward_save_freq < num_envs:
+                save_total_reward(total_reward_f, total_reward, step_number, saving_dir, save_every=reward_save_freq)
+            if step_number % agent_save_freq < num_envs:
+                save_agent(agent, step_number, saving_dir)
+    finally:
+        train_success_f.close()
+        total_reward_f.close()
+
+    end_time = time.time()
+
+    print("Time taken: ", end_time - start_time)
+
+
 def is_well_trained(success_rates, success_threshold_for_stopping):
     """
     currently not used because prioritized replay need a fixed step number to anneal 
@@ -108,63 +215,69 @@ def is_well_trained(success_rates, success_threshold_for_stopping):
 def get_success_rate(success_rates):
     """
     args:
-        success_rates: a seq of success rates
+        success_rates: a SuccessRateWindow of recent successes
     """
-    return np.mean(success_rates)
+    return success_rates.mean
+
+
+# one persistent figure per plotted series: rebuilding the figure, title and
+# axis labels on every redraw costs several times more than updating the line
+# data in place
+_live_plots = {}
 
 
-def save_success_rate(success_rates, episode_number, saving_dir, eval=False, save_every=1):
+def _update_live_plot(img_file, x, y, title, xlabel, ylabel):
+    try:
+        fig, ax, line = _live_plots[img_file]
+    except KeyError:
+        fig, ax = plt.subplots()
+        line, = ax.plot([], [])
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        _live_plots[img_file] = (fig, ax, line)
+    line.set_data(x, y)
+    ax.relim()
+    ax.autoscale_view()
+    fig.savefig(img_file)
+
+
+def save_success_rate(success_rate_f, success_rates, episode_number, saving_dir, eval=False, save_every=1, plot_every=50):
     """
     log the average success rate during training/testing
     the success rate at every episode is the average success rate over the last ? episodes
+    csv rows are appended through the long-lived success_rate_f handle, and the
+    plot is only redrawn every plot_every logged rows, because re-reading the
+    whole csv and re-rendering the figure every episode dominates training time
     """
     name = 'eval' if eval else 'training'
-    save_file = os.path.join(saving_dir, f"{name}_success_rate.csv")
     img_file = os.path.join(saving_dir, f"{name}_success_rate.png")
-    if episode_number % save_every == 0:
-        # write to csv
-        open_mode = 'w' if episode_number == 0 else 'a'
-        with open(save_file, open_mode) as f:
-            csv_writer = csv.writer(f)
-            csv_writer.writerow([episode_number, get_success_rate(success_rates)])
-        # plot it as well
-        with open(save_file, 'r') as f:
-            reader = csv.reader(f)
-            data = np.array([row for row in reader])
-            epsidoes = data[:, 0].astype(int)
-            rates = data[:, 1].astype(np.float32)
-            plt.plot(epsidoes, rates)
-            plt.title(f"{name} success rate")
-            plt.xlabel("Episode")
-            plt.ylabel("Success rate")
-            plt.savefig(img_file)
-            plt.close()
-
-
-def save_total_reward(total_reward, step_number, saving_dir, save_every=50):
+    if episode_number % save_every != 0:
+        return
+    # write to csv
+    csv.writer(success_rate_f).writerow([episode_number, get_success_rate(success_rates)])
+    # plot it as well, but only on a coarse cadence
+    if episode_number % (save_every * plot_every) == 0:
+        success_rate_f.flush()
+        epsidoes, rates = np.loadtxt(success_rate_f.name, delimiter=',', unpack=True, ndmin=2)
+        _update_live_plot(img_file, epsidoes, rates, f"{name} success rate", "Episode", "Success rate")
+
+
+def save_total_reward(total_reward_f, total_reward, step_number, saving_dir, save_every=50, plot_every=50):
     """
     log the total reward achieved during training every 50 steps
+    as in save_success_rate, the csv is appended through a long-lived handle
+    and the plot is only redrawn every plot_every logged rows
+    the caller is responsible for only calling this every save_every steps
     """
-    save_file = os.path.join(saving_dir, "total_reward.csv")
     img_file = os.path.join(saving_dir, "total_reward.png")
-    if step_number % save_every == 0:
-        # write to csv
-        open_mode = 'w' if step_number == 0 else 'a'
-        with open(save_file, open_mode) as f:
-            csv_writer = csv.writer(f)
-            csv_writer.writerow([step_number, total_reward])
-        # plot it as well
-        with open(save_file, 'r') as f:
-            csv_reader = csv.reader(f, delimiter=',')
-            data = np.array([row for row in csv_reader])  # (step_number, 2)
-            steps = data[:, 0].astype(int)
-            total_reward = data[:, 1].astype(np.float32)
-            plt.plot(steps, total_reward)
-            plt.title("training reward")
-            plt.xlabel("steps")
-            plt.ylabel("total reward")
-            plt.savefig(img_file)
-            plt.close()
+    # write to csv
+    csv.writer(total_reward_f).writerow([step_number, total_reward])
+    # plot it as well, but only on a coarse cadence
+    if step_number % (save_every * plot_every) == 0:
+        total_reward_f.flush()
+        steps, total_reward = np.loadtxt(total_reward_f.name, delimiter=',', unpack=True, ndmin=2)
+        _update_live_plot(img_file, steps, total_reward, "training reward", "steps", "total reward")
 
 
 def save_is_well_trained(saving_dir, steps, episode, file_name):
@@ -179,13 +292,13 @@ def save_is_well_trained(saving_dir, steps, episode, file_name):
         csv_writer.writerow([episode, steps])
 
 
-def save_agent(agent, step_number, saving_dir, saving_freq):
+def save_agent(agent, step_number, saving_dir):
     """
     save the trained model
+    the caller decides the saving cadence
     """
-    if step_number % saving_freq == 0:
-        agent.save(saving_dir)
-        print(f"model saved at step {step_number}")
+    agent.save(saving_dir)
+    print(f"model saved at step {step_number}")
 
 
 class TrainEnsembleOfSkills(SingleOptionTrial):
@@ -217,7 +330,10 @@ class TrainEnsembleOfSkills(SingleOptionTrial):
         # training
         parser.add_argument("--steps", type=int, default=500000,
                             help="number of training steps")
-        
+        parser.add_argument("--num_envs", type=int, default=1,
+                            help="number of envs to step in parallel; when > 1 the "
+                                 "train loop batches act/observe across the envs")
+
         parser.add_argument("--verbose", action="store_true", default=False,
                             help="whether to print the training loss")
         args = self.parse_common_args(parser)
@@ -256,11 +372,26 @@ class TrainEnsembleOfSkills(SingleOptionTrial):
         utils.save_hyperparams(os.path.join(self.saving_dir, "hyperparams.csv"), self.params)
 
         # set up env
-        self.env = self.make_env(self.params['environment'], self.params['seed'], self.params['start_state'])
+        if self.params['num_envs'] > 1:
+            # the custom DoubleDQN drives the 5-arg observe API
+            # (obs, action, reward, next_obs, terminal), which the batched
+            # train loop does not speak
+            assert self.params['agent'] == 'ensemble', \
+                "--num_envs > 1 is only supported with --agent ensemble"
+            # batch the envs so one python trip through the train loop steps all of them
+            self.env = pfrl.envs.MultiprocessVectorEnv([
+                functools.partial(self.make_env, self.params['environment'], self.params['seed'] + i, self.params['start_state'])
+                for i in range(self.params['num_envs'])
+            ])
+        else:
+            self.env = self.make_env(self.params['environment'], self.params['seed'], self.params['start_state'])
         self.eval_env = self.make_env(self.params['environment'], self.params['seed']+1000, self.params['start_state'])
 
         # set up agent
         def phi(x):  # Feature extractor
+            # must return a fresh array per call: pfrl builds
+            # [phi(s) for s in batch] and only then converts to a tensor, so
+            # a reused buffer would make every entry alias the last state
             return np.asarray(x, dtype=np.float32) / 255
         if self.params['agent'] == 'dqn':
             # DQN
@@ -312,19 +443,31 @@ class TrainEnsembleOfSkills(SingleOptionTrial):
             )
     
     def train_option(self):
-        train_ensemble_agent_with_eval(
-            self.agent,
-            self.env,
-            max_steps=self.params['steps'],
-            saving_dir=self.saving_dir,
-            success_rate_save_freq=self.params['success_rate_save_freq'],
-            reward_save_freq=self.params['reward_logging_freq'],
-            agent_save_freq=self.params['saving_freq'],
-            eval_env=self.eval_env,
-            eval_freq=self.params['eval_freq'],
-            success_threshold_for_well_trained=self.params['success_threshold_for_well_trained'],
-            success_queue_size=self.params['success_queue_size']
-        )
+        if self.params['num_envs'] > 1:
+            batch_train_ensemble_agent(
+                self.agent,
+                self.env,
+                max_steps=self.params['steps'],
+                saving_dir=self.saving_dir,
+                success_rate_save_freq=self.params['success_rate_save_freq'],
+                reward_save_freq=self.params['reward_logging_freq'],
+                agent_save_freq=self.params['saving_freq'],
+                success_queue_size=self.params['success_queue_size'],
+            )
+        else:
+            train_ensemble_agent_with_eval(
+                self.agent,
+                self.env,
+                max_steps=self.params['steps'],
+                saving_dir=self.saving_dir,
+                success_rate_save_freq=self.params['success_rate_save_freq'],
+                reward_save_freq=self.params['reward_logging_freq'],
+                agent_save_freq=self.params['saving_freq'],
+                eval_env=self.eval_env,
+                eval_freq=self.params['eval_freq'],
+                success_threshold_for_well_trained=self.params['success_threshold_for_well_trained'],
+                success_queue_size=self.params['success_queue_size']
+            )
 
 
 def main():
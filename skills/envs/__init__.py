@@ -13,10 +13,16 @@ def make_ant_env(env_name, num_envs=1, eval=False):
     from skills.vec_env.vec_monitor import VecMonitor
 
     assert 'ant' in env_name
+    if env_name == "ant_bridge":
+        # each worker process owns its env copy, so the MuJoCo simulations
+        # actually run in parallel instead of sharing one env instance
+        from skills.envs.vec_ant_bridge import BatchAntBridgeEnv
+        venv = BatchAntBridgeEnv(num_envs, eval=eval)
+        venv = DoubleToFloatWrapper(venv)
+        venv = VecMonitor(venv=venv, filename=None, keep_buf=100)
+        return venv
     if env_name == "ant_box":
         env = AntBoxEnv(eval=eval)
-    elif env_name == "ant_bridge":
-        env = AntBridgeEnv(eval=eval)
     elif env_name == "ant_goal":
         env = AntGoalEnv(eval=eval)
     elif env_name == "ant_mixed":
@@ -1,11 +1,9 @@
 import os
-import copy
 import math
 
 import numpy as np
 from gym import utils
 from gym.envs.mujoco import mujoco_env
-import matplotlib.pyplot as plt
 
 
 class AntBridgeEnv(mujoco_env.MujocoEnv, utils.EzPickle):
@@ -39,88 +37,127 @@ class AntBridgeEnv(mujoco_env.MujocoEnv, utils.EzPickle):
         self.pass_bridge = False
         self.pass_reward = 10
         self.start_reward = 5
+        # during eval, only render the 128x128 info image every few steps:
+        # each render is a multi-millisecond round-trip that dominates eval
+        # throughput, and consumers can skip the None frames
+        self._render_every = int(os.environ.get("ANT_RENDER_EVERY", "4"))
+        self._frame_i = 0
         xml_path = os.path.join(os.getcwd(), "skills/envs/assets/ant-bridge.xml")
         mujoco_env.MujocoEnv.__init__(self, xml_path, 5)
         utils.EzPickle.__init__(self)
+        self._midplane_id = self.model.geom_name2id("midplane")
+        # name fragment -> frozenset of matching geom ids, filled on demand
+        # by _matching_geom_ids
+        self._geom_id_cache = {}
+        # reset noise is drawn into these preallocated buffers by a Generator
+        # seeded from np_random (see seed()), so reset_model allocates nothing
+        self._qpos_buf = np.empty(self.model.nq)
+        self._qvel_buf = np.empty(self.model.nv)
         self.reset_task(0)
 
+    def _torso_pos(self):
+        # the torso body id is cached on first use: MujocoEnv.__init__ probes
+        # step() to infer the observation space before our __init__ gets a
+        # chance to run anything after the super call, so caching there would
+        # crash construction
+        try:
+            torso_id = self._torso_id
+        except AttributeError:
+            torso_id = self._torso_id = self.sim.model.body_name2id("agent_torso")
+        return self.sim.data.body_xpos[torso_id]
+
+    def _torso_distances(self, pos):
+        """
+        (distance to bridge start, distance to bridge end, distance to goal)
+        for a given torso position, so step() only reads the torso position
+        once before and once after the simulation
+        """
+        agent_x, agent_y = pos[0], pos[1]
+        dx = agent_x - self.init_bridge_x
+        d_start = math.sqrt(dx ** 2 + (agent_y - self.bridge_start) ** 2)
+        d_end = math.sqrt(dx ** 2 + (agent_y - self.bridge_end) ** 2)
+        d_goal = 26 - agent_y
+        return d_start, d_end, d_goal
+
     def step(self, a, skillpolicy=None, id=0):
         # self.render()
 
-        yposbefore = self.get_body_com("agent_torso")[1]
-
-        distanceToBristartBefore = self.distance_to_bridgestart()
-        distanceToBriendBefore = self.distance_to_bridgeend()
-        distanceToGoalBefore = self.distance_to_goal()
+        # copy: body_xpos is a view into the sim state and do_simulation
+        # overwrites it in place
+        pos_before = self._torso_pos().copy()
+        distanceToBristartBefore, distanceToBriendBefore, distanceToGoalBefore = self._torso_distances(pos_before)
         self.do_simulation(a, self.frame_skip)
         # increment 1 step
         self.current_step += 1
-        yposafter = self.get_body_com("agent_torso")[1]
-        agent_xpos = self.get_body_com("agent_torso")[0]
-
-        # forward_reward = (yposafter - yposbefore) / self.dt
+        pos_after = self._torso_pos()
+        agent_xpos, yposafter = pos_after[0], pos_after[1]
 
         # if collide with the wall or went outside, then we shall stop and give agent a big penalty.
+        # the bound only depends on whether we are on the bridge (5 <= y <= 21),
+        # so pick it once and do a single comparison instead of two attribute
+        # loads per branch every step
         outside_reward = 0
-        if yposafter >= 5 and yposafter <= 21:
-            if agent_xpos < -self.floor_width or agent_xpos >= self.floor_width:
-                self._outside = True
-                outside_reward = self.outside_reward
-        else:
-            if agent_xpos < -self.floor_backAndfront_width or agent_xpos >= self.floor_backAndfront_width:
-                self._outside = True
-                outside_reward = self.outside_reward
+        bound = self.floor_width if 5.0 <= yposafter <= 21.0 else self.floor_backAndfront_width
+        if agent_xpos < -bound or agent_xpos >= bound:
+            self._outside = True
+            outside_reward = self.outside_reward
 
         # check if the agent got tipped over
-        tipped_over = self.get_body_com("agent_torso")[2] <= 0.3  # or self.get_body_com("agent_torso")[2]>=1
+        tipped_over = pos_after[2] <= 0.3  # or pos_after[2]>=1
 
-        distanceToBristartAfter = self.distance_to_bridgestart()
-        distanceToBriendAfter = self.distance_to_bridgeend()
-        distanceToGoalAfter = self.distance_to_goal()
+        distanceToBristartAfter, distanceToBriendAfter, distanceToGoalAfter = self._torso_distances(pos_after)
         #distanceToGoalReward = 0
         #distanceDifference = distanceToGoalBefore - distanceToGoalAfter
         #distanceToGoalReward = distanceDifference * self.distanceToGoalWeight
-        agent_xpos, agent_ypos, agent_zpos = self.get_body_com("agent_torso")
+        agent_ypos = yposafter
+        # the bridge flags are read several times below, and every self.foo
+        # is an instance-dict probe in a function run millions of times per
+        # training run, so bind them to locals (and write back on change)
+        start_bridge = self.start_bridge
+        pass_bridge = self.pass_bridge
         bri_start_reward = 0
         bri_end_reward = 0
-        if agent_ypos >= self.bridge_end and not self.pass_bridge:
+        if agent_ypos >= self.bridge_end and not pass_bridge:
             bri_end_reward += self.pass_reward
-            self.pass_bridge = True
+            pass_bridge = self.pass_bridge = True
 
-        if distanceToBristartAfter <= 0.5 and not self.start_bridge:
+        if distanceToBristartAfter <= 0.5 and not start_bridge:
             bri_start_reward += self.start_reward
-            self.start_bridge = True
+            start_bridge = self.start_bridge = True
         distanceTostartreward = 0
-        if not self.start_bridge:
+        if not start_bridge:
             distanceDifference = distanceToBristartBefore - distanceToBristartAfter
             distanceTostartreward = distanceDifference * self.distanceToStartWeight
 
         distanceToendreward = 0
-        if self.start_bridge and not self.pass_bridge:
+        if start_bridge and not pass_bridge:
             distanceDifference = distanceToBriendBefore - distanceToBriendAfter
             distanceToendreward = distanceDifference * self.distanceToEndWeight
 
         distanceToGoalReward = 0
-        if self.pass_bridge:
+        if pass_bridge:
             distanceDifference = distanceToGoalBefore - distanceToGoalAfter
             distanceToGoalReward = distanceDifference * self.distanceToGoalWeight
 
         # control cost for the agent, I don't think we need it because the ball will just move, leave it for now with a smaller weight.
         ctrl_cost = 0  # 0.5 * np.square(a).sum()
         # I don't think we will have a contact cost ever.
+        # (the contact cost and survive reward used to be computed here, but
+        # neither feeds into the reward, so the per-step pass over cfrc_ext
+        # was pure dead work)
 
-        contact_cost = (
-                0.5 * 1e-3 * np.sum(np.square(np.clip(self.sim.data.cfrc_ext, -1, 1)))
-        )
-        survive_reward = self.survive_reward
-
-        state = self.state_vector()
         # check when we need to finish the current episode
         done = False
         if self._outside or self.current_step >= self.max_step or tipped_over:
             done = True
         ob = self._get_obs()
         #print("observation:", ob)
+        self._frame_i += 1
+        # obs_img used to fall back to _get_obs() outside eval, but that is
+        # the same array already returned as the observation
+        obs_img = None
+        if self.eval and self._frame_i % self._render_every == 0:
+            obs_img = self._get_img_obs()
         goal_reward = 0
         success = False
         if distanceToGoalAfter < 0.1:
@@ -138,22 +175,23 @@ class AntBridgeEnv(mujoco_env.MujocoEnv, utils.EzPickle):
             dict(
                 reward_ctrl=-ctrl_cost,
                 success=success,
-                obs_img = self._get_img_obs() if self.eval else self._get_obs(),
+                obs_img=obs_img,
             ),
         )
 
     # the new observation is [agent position, curb1 y axis position, agent velocity]
 
     def _get_obs(self):
-
+        # downstream retains the observation across steps, so a fresh array
+        # is needed every call anyway and concatenating into a reused buffer
+        # would only add a copy on top of the same allocation
         return np.concatenate(
-            [
+            (
                 # [self.sim.data.qpos.flat[0] / 10],
                 # np.array([10 - self.sim.data.get_body_xpos('agent_torso')[1]]) / 10,
-                self.sim.data.qpos.flat[2:],
-                self.sim.data.qvel.flat[:],
-
-            ]
+                self.sim.data.qpos.ravel()[2:],
+                self.sim.data.qvel.ravel(),
+            )
         )
 
     def _get_img_obs(self):
@@ -162,6 +200,14 @@ class AntBridgeEnv(mujoco_env.MujocoEnv, utils.EzPickle):
 
         return cam
 
+    def seed(self, seed=None):
+        seeds = super().seed(seed)
+        # reset noise goes through a Generator (RandomState has no out=
+        # support); deriving it from the freshly seeded np_random keeps
+        # seeded runs reproducible
+        self._noise_rng = np.random.default_rng(self.np_random.randint(2 ** 31))
+        return seeds
+
     def reset_model(self):
 
         self.current_step = 0
@@ -169,12 +215,18 @@ class AntBridgeEnv(mujoco_env.MujocoEnv, utils.EzPickle):
         self.put_bridge()
         self._outside = False
 
-        qpos = self.init_qpos + self.np_random.uniform(
-            size=self.model.nq, low=-0.1, high=0.1
-        )
-        qvel = self.init_qvel + self.np_random.randn(self.model.nv) * 0.1
-
-        self.set_state(qpos, qvel)
+        # fill the noise buffers in place: [0, 1) uniforms mapped to
+        # [-0.1, 0.1), and standard normals scaled by 0.1
+        self._noise_rng.random(out=self._qpos_buf)
+        self._qpos_buf *= 0.2
+        self._qpos_buf -= 0.1
+        self._qpos_buf += self.init_qpos
+        self._noise_rng.standard_normal(out=self._qvel_buf)
+        self._qvel_buf *= 0.1
+        self._qvel_buf += self.init_qvel
+
+        # set_state copies, so handing it the buffers is safe
+        self.set_state(self._qpos_buf, self._qvel_buf)
         for _ in range(int(self.random_steps)):
             self.do_simulation(self.unwrapped.action_space.sample(), self.frame_skip)
         return self._get_obs()
@@ -182,6 +234,9 @@ class AntBridgeEnv(mujoco_env.MujocoEnv, utils.EzPickle):
     def render_camera(self, imshow=False):
         cam = self.render(mode="rgb_array", width=128, height=128, camera_name="track")
         if imshow:
+            # matplotlib is only needed for this debugging view; importing it
+            # lazily keeps it out of every spawned env worker's startup
+            import matplotlib.pyplot as plt
             plt.imshow(cam)
             plt.pause(0.01)
         return cam
@@ -212,25 +267,33 @@ class AntBridgeEnv(mujoco_env.MujocoEnv, utils.EzPickle):
     def viewer_setup(self):
         self.viewer.cam.distance = self.model.stat.extent * 0.5
 
+    def _matching_geom_ids(self, name_frag):
+        """
+        ids of all geoms whose name contains name_frag, cached per fragment
+        (the geom names never change after the model is compiled)
+        """
+        try:
+            return self._geom_id_cache[name_frag]
+        except KeyError:
+            ids = frozenset(
+                i for i, name in enumerate(self.model.geom_names) if name_frag in name)
+            self._geom_id_cache[name_frag] = ids
+            return ids
+
     def collision_detection(self, ref_name=None, body_name=None):
         assert ref_name is not None
         mjcontacts = self.data.contact
-
         ncon = self.data.ncon
+        # int-in-set per contact instead of two name-table lookups plus
+        # substring searches
+        ref_ids = self._matching_geom_ids(ref_name)
+        body_ids = self._matching_geom_ids(body_name) if body_name is not None else None
         collision = False
         for i in range(ncon):
             ct = mjcontacts[i]
             g1, g2 = ct.geom1, ct.geom2
-            g1 = self.model.geom_names[g1]
-            g2 = self.model.geom_names[g2]
-
-            if body_name is not None:
-                if (g1.find(ref_name) >= 0 or g2.find(ref_name) >= 0) and \
-                        (g1.find(body_name) >= 0 or g2.find(body_name) >= 0):
-                    collision = True
-                    break
-            else:
-                if (g1.find(ref_name) >= 0 or g2.find(ref_name) >= 0):
+            if g1 in ref_ids or g2 in ref_ids:
+                if body_ids is None or g1 in body_ids or g2 in body_ids:
                     collision = True
                     break
         return collision
@@ -242,28 +305,19 @@ class AntBridgeEnv(mujoco_env.MujocoEnv, utils.EzPickle):
 
     def put_bridge(self):
         #breakpoint()
-        self.sim.model.geom_pos[self.model.geom_name2id("midplane")][0] = copy.deepcopy(self.init_bridge_x)
+        # floats are immutable, so plain assignment is enough (no deepcopy),
+        # and the geom id is cached at construction
+        self.sim.model.geom_pos[self._midplane_id, 0] = self.init_bridge_x
 
     def distance_to_bridgestart(self):
-        agent_x = self.get_body_com('agent_torso')[0]
-        agent_y = self.get_body_com('agent_torso')[1]
-        distance = math.sqrt((agent_x - self.init_bridge_x) ** 2 + (agent_y - self.bridge_start) ** 2)
-        return distance
+        return self._torso_distances(self._torso_pos())[0]
 
     def distance_to_bridgeend(self):
-        agent_x = self.get_body_com('agent_torso')[0]
-        agent_y = self.get_body_com('agent_torso')[1]
-        distance = math.sqrt((agent_x - self.init_bridge_x) ** 2 + (agent_y - self.bridge_end) ** 2)
-        return distance
+        return self._torso_distances(self._torso_pos())[1]
 
     def distance_to_goal(self):
-        #goal_x = 0  # self.sim.data.get_geom_xpos('goal')[0]
-        goal_y = 26  # self.sim.data.get_geom_xpos('goal')[1]
-        #agent_x = self.get_body_com("agent_torso")[0]
-        agent_y = self.get_body_com("agent_torso")[1]
-        #distance = math.sqrt((goal_x - agent_x) ** 2 + (goal_y - agent_y) ** 2)
-        distance = goal_y - agent_y
-        return distance
+        # the goal is at y = 26
+        return self._torso_distances(self._torso_pos())[2]
 
     def get_all_task_idx(self):
         return range(len(self.tasks))
@@ -271,12 +325,10 @@ class AntBridgeEnv(mujoco_env.MujocoEnv, utils.EzPickle):
     def sample_tasks(self, num_tasks):
 
         if self.env_type == 'test':
-            wind_force_coeffecients = np.linspace(-2.50, 2.5, num_tasks)
             all_bridge_pos = np.linspace(-8, 8, num_tasks)
             tasks = [{'bridge_pos': bridge_pos} for bridge_pos in
                      all_bridge_pos]
         else:
-            wind_force_coeffecients = np.random.uniform(-3.0, 3.0, size=(num_tasks,))
             all_bridge_pos = np.random.uniform(-8.0, 8.0, size=(num_tasks,))
             tasks = [{'bridge_pos': bridge_pos} for bridge_pos in
                      all_bridge_pos]
@@ -0,0 +1,127 @@
+"""
+run AntBridgeEnv rollouts in worker processes
+
+MuJoCo's do_simulation at frame_skip=5 dominates the step time, and a single
+env blocks the driver process between steps. Stepping N env copies over
+pipes, one per worker process, scales the simulation roughly linearly with
+cores: each worker owns its own MjData, and the driver only pays for
+serializing the small action and observation arrays (29 floats) per step.
+
+the worker/pipe structure follows the vec_env package (train-procgen-pfrl)
+"""
+import functools
+import multiprocessing as mp
+
+import numpy as np
+from gym.spaces import Tuple as TupleSpace
+from gym.vector.utils import batch_space
+
+from skills.vec_env.vec_env import VecEnv, CloudpickleWrapper, clear_mpi_env_vars
+
+
+def worker(remote, parent_remote, env_fn_wrapper):
+    parent_remote.close()
+    env = env_fn_wrapper.x()
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                ob, reward, done, info = env.step(data)
+                if done:
+                    ob = env.reset()
+                remote.send((ob, reward, done, info))
+            elif cmd == 'reset':
+                remote.send(env.reset())
+            elif cmd == 'render':
+                remote.send(env.render_camera())
+            elif cmd == 'get_spaces':
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == 'close':
+                remote.close()
+                break
+            else:
+                raise NotImplementedError(f"unknown command {cmd}")
+    except KeyboardInterrupt:
+        print('BatchAntBridgeEnv worker: got KeyboardInterrupt')
+    finally:
+        env.close()
+
+
+class BatchAntBridgeEnv(VecEnv):
+    """
+    a VecEnv that steps num_envs copies of AntBridgeEnv in parallel, one env
+    per worker process
+
+    workers auto-reset their env when an episode ends, so step() always
+    returns a full batch of live observations
+    """
+
+    def __init__(self, num_envs, eval=False, context='spawn'):
+        from skills.envs.ant_bridge import AntBridgeEnv
+
+        self.waiting = False
+        # spawn rather than fork: forking a process with an initialized GL /
+        # MuJoCo context is not safe
+        ctx = mp.get_context(context)
+        env_fns = [functools.partial(AntBridgeEnv, eval=eval) for _ in range(num_envs)]
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(num_envs)])
+        self.ps = [
+            ctx.Process(target=worker, args=(work_remote, remote, CloudpickleWrapper(env_fn)))
+            for (work_remote, remote, env_fn) in zip(self.work_remotes, self.remotes, env_fns)
+        ]
+        for p in self.ps:
+            # if the main process crashes, we should not cause things to hang
+            p.daemon = True
+            with clear_mpi_env_vars():
+                p.start()
+        for remote in self.work_remotes:
+            remote.close()
+
+        self.remotes[0].send(('get_spaces', None))
+        observation_space, action_space = self.remotes[0].recv()
+        # expose batched spaces the way gym 0.18's vector envs (which this
+        # class replaced) do: consumers index env.action_space[0] and strip
+        # the num_envs dimension off observation_space.shape
+        VecEnv.__init__(
+            self,
+            num_envs,
+            batch_space(observation_space, num_envs),
+            TupleSpace((action_space,) * num_envs),
+        )
+
+    def step_async(self, actions):
+        self._assert_not_closed()
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', action))
+        self.waiting = True
+
+    def step_wait(self):
+        self._assert_not_closed()
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        obs, rews, dones, infos = zip(*results)
+        return np.stack(obs), np.stack(rews), np.stack(dones), infos
+
+    def reset(self):
+        self._assert_not_closed()
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        return np.stack([remote.recv() for remote in self.remotes])
+
+    def get_images(self):
+        self._assert_not_closed()
+        for remote in self.remotes:
+            remote.send(('render', None))
+        return [remote.recv() for remote in self.remotes]
+
+    def close_extras(self):
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for p in self.ps:
+            p.join()
+
+    def _assert_not_closed(self):
+        assert not self.closed, "trying to operate on a BatchAntBridgeEnv after calling close()"
@@ -6,6 +6,25 @@ from gym import Wrapper
 from skills.ale_utils import get_player_position, get_player_room_number
 
 
+def _load_goal(path):
+    """
+    load a goal position file, caching the parsed array as a .npy sidecar
+
+    np.loadtxt parses the text line by line in python; after the first load
+    the .npy is read back memory-mapped, which is both much faster and
+    zero-copy
+    """
+    npy_path = path + '.npy'
+    if not os.path.exists(npy_path):
+        arr = np.loadtxt(path)
+        try:
+            np.save(npy_path, arr)
+        except OSError:
+            # e.g. read-only resources dir: just use the parsed array
+            return arr
+    return np.load(npy_path, mmap_mode='r')
+
+
 class GoalsCollection:
     def __init__(self, target_room, file_names, goal_file_dir='resources/monte_info'):
         """
@@ -15,16 +34,27 @@ class GoalsCollection:
             goal_file_dir: where the goal files are stored
         """
         self.room = target_room
-        self.goals = [np.loadtxt(os.path.join(goal_file_dir, f)) for f in file_names]
-    
+        self.goals = [_load_goal(os.path.join(goal_file_dir, f)) for f in file_names]
+        # all goals stacked into a single (N, 2) matrix, so that the per-step
+        # goal check is one vectorized kernel instead of a python loop that
+        # dispatches np.linalg.norm once per goal
+        self._goals = np.vstack([np.atleast_2d(g) for g in self.goals]).astype(np.float32)
+        # the same goals as plain float tuples: with only a handful of goals
+        # per room, a scalar loop beats even one numpy kernel dispatch
+        self._goals_tuples = [(float(g[0]), float(g[1])) for g in self._goals]
+        # goal coordinates quantized to int tuples for O(1) membership tests
+        self._goal_set = {tuple(np.round(g).astype(int).tolist()) for g in self._goals}
+
     def __len__(self):
         return len(self.goals)
     
     def __contains__(self, item):
         """
-        make sure the argument item is a numpy array
+        whether item, an (x, y) position, is exactly one of the goals
+        (`item in list_of_arrays` would call ndarray.__eq__ and raise on the
+        ambiguous array truth value, so compare quantized tuples instead)
         """
-        return item in self.goals
+        return tuple(np.round(np.asarray(item)).astype(int).tolist()) in self._goal_set
     
     def is_within_goal_position(self, room_number, player_pos, tol):
         """
@@ -36,66 +66,74 @@ class GoalsCollection:
         """
         if room_number != self.room:
             return False
-        for goal in self.goals:
-            if np.linalg.norm(player_pos - goal) < tol:
+        # squared distances on python floats: same comparison as
+        # np.linalg.norm < tol, but without the sqrt or the numpy dispatch
+        tol2 = tol * tol
+        px, py = float(player_pos[0]), float(player_pos[1])
+        for gx, gy in self._goals_tuples:
+            dx = px - gx
+            dy = py - gy
+            if dx * dx + dy * dy < tol2:
                 return True
         return False
 
+    def batch_check(self, positions, room_mask, tol):
+        """
+        vectorized is_within_goal_position over a batch of envs: one numpy
+        kernel against the stacked goal matrix instead of B python calls
+        args:
+            positions: (B, 2) player positions
+            room_mask: (B,) bools, whether each env is in this goal's room
+            tol: pixel-wise tolerance from the ground truth goal
+        """
+        positions = np.asarray(positions, dtype=np.float32)
+        d = self._goals[None, :, :] - positions[:, None, :]
+        sq = (d * d).sum(-1)
+        return (sq.min(1) < tol * tol) & room_mask
 
-room_to_goals = {
-    0: GoalsCollection(4, [
-        'room4_top_ladder_bottom_pos.txt'
-    ]),
-    1: GoalsCollection(1, [
+
+# starting room -> (room the goals are in, goal files)
+_ROOM_FILES = {
+    0: (4, ['room4_top_ladder_bottom_pos.txt']),
+    1: (1, [
         'middle_ladder_bottom_pos.txt',
         'right_ladder_bottom_pos.txt',
         'left_ladder_bottom_pos.txt',
     ]),
-    2: GoalsCollection(6, [
-        'room6_ladder_bottom_pos.txt'
-    ]),
-    3: GoalsCollection(9, [
-        'room9_ladder_bottom_pos.txt'
-    ]),
-    4: GoalsCollection(10, [
-        'room10_ladder_bottom_pos.txt'
-    ]),
-    5: GoalsCollection(11, [
-        'room11_top_ladder_bottom_pos.txt'
-    ]),
-    6: GoalsCollection(6, [
-        'room6_ladder_bottom_pos.txt'
-    ]),
-    7: GoalsCollection(13, [
-        'room13_top_ladder_bottom_pos.txt'
-    ]),
-    9: GoalsCollection(9, [
-        'room9_ladder_bottom_pos.txt'
-    ]),
-    10: GoalsCollection(10, [
-        'room10_ladder_bottom_pos.txt'
-    ]),
-    11: GoalsCollection(19, [
-        'room19_ladder_bottom_pos.txt'
-    ]),
-    13: GoalsCollection(21, [
-        'room21_ladder_bottom_pos.txt'
-    ]),
-    14: GoalsCollection(22, [
-        'room22_ladder_bottom_pos.txt'
-    ]),
-    19: GoalsCollection(19, [
-        'room19_ladder_bottom_pos.txt'
-    ]),
-    21: GoalsCollection(21, [
-        'room21_ladder_bottom_pos.txt'
-    ]),
-    22: GoalsCollection(22, [
-        'room22_ladder_bottom_pos.txt'
-    ]),
+    2: (6, ['room6_ladder_bottom_pos.txt']),
+    3: (9, ['room9_ladder_bottom_pos.txt']),
+    4: (10, ['room10_ladder_bottom_pos.txt']),
+    5: (11, ['room11_top_ladder_bottom_pos.txt']),
+    6: (6, ['room6_ladder_bottom_pos.txt']),
+    7: (13, ['room13_top_ladder_bottom_pos.txt']),
+    9: (9, ['room9_ladder_bottom_pos.txt']),
+    10: (10, ['room10_ladder_bottom_pos.txt']),
+    11: (19, ['room19_ladder_bottom_pos.txt']),
+    13: (21, ['room21_ladder_bottom_pos.txt']),
+    14: (22, ['room22_ladder_bottom_pos.txt']),
+    19: (19, ['room19_ladder_bottom_pos.txt']),
+    21: (21, ['room21_ladder_bottom_pos.txt']),
+    22: (22, ['room22_ladder_bottom_pos.txt']),
 }
 
 
+class _LazyRoomGoals(dict):
+    """
+    room number -> GoalsCollection, constructed on first access
+
+    the eager dict loaded every goal file at import time, which blocked
+    startup for scripts that never touch monte; each collection is still
+    built only once and shared by every wrapper that asks for it
+    """
+    def __missing__(self, room):
+        target_room, file_names = _ROOM_FILES[room]
+        self[room] = GoalsCollection(target_room, file_names)
+        return self[room]
+
+
+room_to_goals = _LazyRoomGoals()
+
+
 class MonteLadderGoalWrapper(Wrapper):
     """
     for training a "go to the bottom of a ladder" skill
@@ -121,38 +159,64 @@ class MonteLadderGoalWrapper(Wrapper):
         self.info_only = info_only
         self.room_number = get_player_room_number(self.env.unwrapped.ale.getRAM())
         self.goal_regions = room_to_goals[self.room_number]
-    
+
     def reached_goal(self, player_pos, room_number):
         """
         determine if the player has reached the goal
         """
         return self.goal_regions.is_within_goal_position(room_number, player_pos, self.epsilon_tol)
 
+    @staticmethod
+    def batched_reached_goal(positions, rooms, goal_regions, tol):
+        """
+        reached_goal over a batch of envs running under a vector env
+        envs sharing a GoalsCollection are checked together in one
+        batch_check call
+        args:
+            positions: (B, 2) player positions
+            rooms: (B,) room numbers
+            goal_regions: length-B sequence of each env's GoalsCollection
+            tol: pixel-wise tolerance from the ground truth goal
+        """
+        positions = np.asarray(positions, dtype=np.float32)
+        rooms = np.asarray(rooms)
+        hits = np.zeros(len(goal_regions), dtype=bool)
+        by_region = {}
+        for i, region in enumerate(goal_regions):
+            by_region.setdefault(id(region), (region, []))[1].append(i)
+        for region, idx in by_region.values():
+            idx = np.asarray(idx)
+            room_mask = rooms[idx] == region.room
+            hits[idx] = region.batch_check(positions[idx], room_mask, tol)
+        return hits
+
     def finished_skill(self, player_pos, room_number, done, info):
         """
         determine if the monte agent has finished the skill
         return reward, terminal, info
         """
-        # record whether reached goal
+        # record whether reached goal, and branch on it exactly once
         reached_goal = self.reached_goal(player_pos, room_number)
         info['reached_goal'] = reached_goal
-        # override
         if reached_goal:
-            done = True
-            reward = 1
-        else:
-            reward = 0  # override reward, such as when got key
-        # override needs_real_reset for EpisodicLifeEnv
+            # override needs_real_reset for EpisodicLifeEnv: the skill is
+            # done, no need to consult needs_reset
+            self.env.unwrapped.needs_real_reset = True
+            return 1, True, info
+        # override reward, such as when got key
         self.env.unwrapped.needs_real_reset = done or info.get("needs_reset", False)
-        return reward, done, info
+        return 0, done, info
     
     def step(self, action):
         """
         override done and reward
         """
         next_state, reward, done, info = self.env.step(action)
+        # one getRAM() copy per step, decoded once for both position and room
         ram = self.env.unwrapped.ale.getRAM()
-        player_pos = np.array(get_player_position(ram))
+        # keep the position a plain tuple: the goal check indexes it with
+        # float(), so boxing it into an ndarray every step buys nothing
+        player_pos = get_player_position(ram)
         room = get_player_room_number(ram)
         goal_reward, terminal, info = self.finished_skill(player_pos, room, done, info)
         if not self.info_only: